@@ -1,10 +1,37 @@
+import atexit
+import random
+import threading
 import time
+from concurrent.futures import ThreadPoolExecutor
 from datetime import datetime
+from enum import IntEnum
 
 import pytz
 import requests
-import six
-from dateutil.parser import isoparse
+from requests.adapters import HTTPAdapter
+from urllib3.util import make_headers
+from urllib3.util.retry import Retry
+
+try:
+    # orjson parses JSON substantially faster than the standard library, so use it if it is available.
+    import orjson
+except ImportError:
+    orjson = None
+
+try:
+    # ciso8601 parses ISO 8601 dates substantially faster than dateutil, so use it if it is available.
+    from ciso8601 import parse_datetime as isoparse
+except ImportError:
+    from dateutil.parser import isoparse
+
+
+# Default fields requested when generating reports, if none are specified.
+DEFAULT_INBOX_CONTACT_FIELDS = ("group", "upload_date")
+DEFAULT_SURVEY_RESPONSE_FORMATS = ("raw", "label")
+DEFAULT_SURVEY_CONTACT_FIELDS = ("name", "phone")
+
+# Timezone of dates exported by Echo Mobile which end in ' EAT'.
+_EAT = pytz.timezone("Africa/Nairobi")
 
 
 class EchoMobileError(Exception):
@@ -24,7 +51,7 @@ class NoSessionDataError(Exception):
         super().__init__(message)
 
 
-class ReportType(object):
+class ReportType(IntEnum):
     """
     Contains the report types which Echo Mobile can export, and the corresponding ids used by Echo Mobile
     for each report type.
@@ -36,14 +63,18 @@ class ReportType(object):
     AllMessagesReport = 17
 
 
-class MessageDirection(object):
+class MessageDirection(IntEnum):
+    """
+    Contains the message directions which Echo Mobile can filter message reports by, and the corresponding ids used
+    by Echo Mobile for each direction.
+    """
     # These IDs were determined by inspecting the REST calls which the website was making when generating reports.
     Incoming = 0
     Outgoing = 1
     Both = 2
 
 
-class FileType(object):
+class FileType(IntEnum):
     """
     Contains the file types which Echo Mobile can export reports to, and the corresponding ids used by Echo Mobile
     for each file type.
@@ -58,47 +89,230 @@ class EchoMobileSession(object):
     A client-side API for interacting with Echo Mobile servers.
     
     For example, to download a survey report:
-    >>> session = EchoMobileSession() # doctest: +SKIP
+    >>> with EchoMobileSession() as session: # doctest: +SKIP
+    ...     session.login(<USERNAME>, <PASSWORD>)
+    ...     session.use_account_with_name(<ACCOUNT_NAME>)  # Optional for users with only one account
+    ...     report = session.survey_report_for_name(<SURVEY_NAME>)
+
+    On leaving the with block, the report background task is removed from the Echo Mobile website and the session's
+    connections are closed. Sessions which are not used as a context manager should call close() once finished with.
+
+    Pipelines which download several reports should log in once and re-use the same session for every report, so
+    that connections to Echo Mobile are kept alive between requests. EchoMobileSession.shared() provides a single
+    session for the whole process, which is closed automatically when the process exits:
+    >>> session = EchoMobileSession.shared() # doctest: +SKIP
     >>> session.login(<USERNAME>, <PASSWORD>) # doctest: +SKIP
-    >>> session.use_account_with_name(<ACCOUNT_NAME>)  # Optional for users with only one account # doctest: +SKIP
-    >>> report = session.survey_report_for_name(<SURVEY_NAME>) # doctest: +SKIP
-    >>> session.delete_session_background_tasks()  # Removes the report background task from the Echo Mobile website. # doctest: +SKIP
+    >>> survey_report = session.survey_report_for_name(<SURVEY_NAME>) # doctest: +SKIP
+    >>> inbox_report = EchoMobileSession.shared().inbox_report() # doctest: +SKIP
     """
     BASE_URL = "https://www.echomobile.org/api/"
 
-    _log_start_time = 0
-
-    def __init__(self, verbose=False):
+    # Full URLs of the endpoints used, computed once rather than on every request.
+    _URL_AUTHENTICATE = BASE_URL + "authenticate/simple"
+    _URL_AUTHENTICATE_LINKED = BASE_URL + "authenticate/linked"
+    _URL_ACCOUNTS = BASE_URL + "cms/account/me"
+    _URL_GROUPS = BASE_URL + "cms/group"
+    _URL_SURVEYS = BASE_URL + "cms/survey"
+    _URL_BACKGROUND_TASKS = BASE_URL + "cms/backgroundtask"
+    _URL_CANCEL_BACKGROUND_TASK = BASE_URL + "cms/backgroundtask/cancel"
+    _URL_GENERATE_REPORT = BASE_URL + "cms/report/generate"
+    _URL_SERVE_REPORT = BASE_URL + "cms/report/serve"
+
+    # Comma-separated forms of the default report fields, as sent to Echo Mobile.
+    _DEFAULT_INBOX_CONTACT_FIELDS = ",".join(DEFAULT_INBOX_CONTACT_FIELDS)
+    _DEFAULT_SURVEY_RESPONSE_FORMATS = ",".join(DEFAULT_SURVEY_RESPONSE_FORMATS)
+    _DEFAULT_SURVEY_CONTACT_FIELDS = ",".join(DEFAULT_SURVEY_CONTACT_FIELDS)
+
+    _shared = None
+    _shared_lock = threading.Lock()
+
+    def __init__(self, verbose=False, cache_ttl=60):
         """
         :param verbose: Whether to initialise with verbose mode enabled.
         :type verbose: bool
+        :param cache_ttl: Time, in seconds, for which the lists of accounts, groups, and surveys fetched from
+                          Echo Mobile are re-used before being fetched again. Set to 0 to disable caching.
+        :type cache_ttl: float
         """
         self.session = requests.Session()
+        # Size the connection pool to match the concurrent requests made by e.g. delete_session_background_tasks,
+        # so that connections are kept alive and re-used rather than discarded.
+        # Retries only apply to idempotent requests, so POSTs which e.g. generate reports are never repeated.
+        adapter = HTTPAdapter(
+            pool_connections=16, pool_maxsize=32,
+            max_retries=Retry(total=3, backoff_factor=0.5, status_forcelist=[429, 500, 502, 503, 504])
+        )
+        self.session.mount("https://", adapter)
+        self.session.mount("http://", adapter)
+        # Ask for compressed responses, which requests transparently decompresses. Reports are CSV, which compresses
+        # well, so this substantially reduces the time spent downloading them. urllib3 also offers brotli, which
+        # compresses CSV better still, if a brotli package is installed.
+        self.session.headers.update(make_headers(accept_encoding=True, keep_alive=True))
         self.verbose = verbose
+        # Start of the operation currently being logged, kept separately by each thread so that operations run
+        # concurrently by e.g. download_reports are timed independently. See log_start.
+        self._log_timing = threading.local()
         self.background_tasks = set()
+        self._background_tasks_lock = threading.Lock()
         self.login_data = None  # Data provided to the user about the current organisation, account etc. on log-in.
+        self._timezone = None  # Cached pytz timezone for login_data["tz"]. See _login_timezone.
+        self.cache_ttl = cache_ttl
+
+        self._accounts_cache = None
+        self._accounts_cache_time = 0
+        self._accounts_etag = None
+        self._account_keys_by_name = dict()
+        self._groups_cache = None
+        self._groups_cache_time = 0
+        self._groups_etag = None
+        self._group_keys_by_name = dict()
+        self._surveys_cache = None
+        self._surveys_cache_time = 0
+        self._surveys_etag = None
+        self._survey_keys_by_name = dict()
+        self._tasks_cache = None  # Background task status from the last poll, re-used on '304 Not Modified'.
+        self._tasks_etag = None
+
+    @classmethod
+    def shared(cls, verbose=False):
+        """
+        Returns the session shared by this process, creating it on first use.
+
+        The shared session is closed when the process exits. Its background tasks are then deleted one at a time,
+        because thread pools refuse new work once the interpreter has started shutting down.
+
+        :param verbose: Whether to enable verbose mode, if the shared session has not been created yet.
+        :type verbose: bool
+        :return: The shared session.
+        :rtype: EchoMobileSession
+        """
+        with cls._shared_lock:
+            if cls._shared is None:
+                cls._shared = cls(verbose=verbose)
+                atexit.register(cls._shared.close, parallel=False)
+            return cls._shared
 
     def log(self, message, **log_args):
         if self.verbose:
-            six.print_("[{}] {}".format(datetime.now().isoformat(), message), **log_args)
+            print("[{}] {}".format(datetime.now().isoformat(), message), **log_args)
 
     def log_start(self, message):
-        self._log_start_time = time.time()
-        self.log(message, end="", flush=True)
+        if self.verbose:
+            # Time the operation with the monotonic clock, so durations are not skewed by changes to the system clock.
+            self._log_timing.start_time = time.monotonic()
+            # Cache the formatted start time, because log_progress re-prints it on every update.
+            self._log_timing.start_iso = datetime.now().isoformat()
+            self.log(message, end="", flush=True)
 
     def log_progress(self, message, progress, **log_args):
         if self.verbose:
-            six.print_("\r[{}] {} {:.2f}%".format(
-                datetime.fromtimestamp(self._log_start_time).isoformat(),
-                message, progress),
-                **log_args)
+            # Fall back to the current time on threads which have not called log_start.
+            start_iso = getattr(self._log_timing, "start_iso", None) or datetime.now().isoformat()
+            print("\r[{}] {} {:.2f}%".format(start_iso, message, progress), **log_args)
 
     def clear_progress(self):
         if self.verbose:
-            six.print_("\r", end="", flush=True)
+            print("\r", end="", flush=True)
 
     def log_done(self):
-        print("Done ({0:.3f}s)".format(time.time() - self._log_start_time))
+        if self.verbose:
+            start_time = getattr(self._log_timing, "start_time", None)
+            if start_time is None:
+                # This thread has not called log_start, so there is no operation to time.
+                print("Done")
+            else:
+                print("Done ({0:.3f}s)".format(time.monotonic() - start_time))
+
+    @staticmethod
+    def _parse_json(request):
+        """
+        Parses the JSON body of a response from Echo Mobile.
+
+        :param request: Response to parse.
+        :type request: requests.Response
+        :return: Parsed JSON.
+        :rtype: dict
+        """
+        if orjson is not None:
+            return orjson.loads(request.content)
+        return request.json()
+
+    def _check_response(self, request):
+        """
+        Parses a response from the Echo Mobile API, and checks that Echo Mobile reported the request as successful.
+
+        :param request: Response to check.
+        :type request: requests.Response
+        :return: Parsed JSON.
+        :rtype: dict
+        :raises EchoMobileError: If Echo Mobile reported that the request failed.
+        :raises requests.HTTPError: If the response was not JSON and had an HTTP error status.
+        """
+        try:
+            response = self._parse_json(request)
+        except ValueError:
+            # Responses which are not JSON are most likely error pages, so report the HTTP error if there is one.
+            request.raise_for_status()
+            raise
+
+        if not response["success"]:
+            raise EchoMobileError(response["message"])
+
+        return response
+
+    def _cache_is_fresh(self, cache, cache_time):
+        return cache is not None and time.monotonic() - cache_time < self.cache_ttl
+
+    def clear_cache(self):
+        """
+        Discards the cached lists of accounts, groups, surveys, and background tasks, so that they are fetched from
+        Echo Mobile on next use.
+        """
+        self._accounts_cache = None
+        self._accounts_etag = None
+        self._account_keys_by_name = dict()
+        self._groups_cache = None
+        self._groups_etag = None
+        self._group_keys_by_name = dict()
+        self._surveys_cache = None
+        self._surveys_etag = None
+        self._survey_keys_by_name = dict()
+        self._tasks_cache = None
+        self._tasks_etag = None
+
+    @staticmethod
+    def _conditional_headers(cache, etag):
+        """
+        Returns the headers to send with a GET request so that Echo Mobile can respond with '304 Not Modified'
+        if the data previously fetched is still up to date.
+
+        :param cache: Data from a previous response, or None if there was no previous response.
+        :type cache: any
+        :param etag: ETag header of the previous response, or None if the server did not provide one.
+        :type etag: str | None
+        :return: Headers to send with the request.
+        :rtype: dict of str -> str
+        """
+        if cache is None or etag is None:
+            return dict()
+        return {"If-None-Match": etag}
+
+    @staticmethod
+    def _keys_by_name(items, name_field):
+        """
+        Indexes a list of Echo Mobile items by name.
+
+        :param items: Items to index, as returned by Echo Mobile. Each item must contain a "key" field.
+        :type items: list of dict
+        :param name_field: Field in each item which contains the item's name.
+        :type name_field: str
+        :return: Dictionary of item name -> keys of all the items with that name.
+        :rtype: dict of str -> list of str
+        """
+        keys_by_name = dict()
+        for item in items:
+            keys_by_name.setdefault(item[name_field], []).append(item["key"])
+        return keys_by_name
 
     def login(self, username, password):
         """
@@ -111,17 +325,16 @@ class EchoMobileSession(object):
         """
         self.log_start("Logging in as '{}'... ".format(username))
 
-        request = self.session.post(self.BASE_URL + "authenticate/simple",
+        request = self.session.post(self._URL_AUTHENTICATE,
                                     params={"_login": username, "_pw": password,
                                             # auth is a magic API key extracted from
                                             # echomobile.org/dist/src/app.build.js
                                             "auth": "JXEIUOVNQLKJDDHA2J", "populate_session": 1})
-        response = request.json()
-
-        if not response["success"]:
-            raise EchoMobileError(response["message"])
+        response = self._check_response(request)
         
         self.login_data = response
+        # The cached accounts, groups, and surveys belong to the previous user, if there was one.
+        self.clear_cache()
 
         self.log_done()
 
@@ -129,23 +342,38 @@ class EchoMobileSession(object):
         """
         Returns the list of accounts available to the user who is currently logged in.
 
+        Results are cached for cache_ttl seconds. Once that time has passed, the list is only downloaded again if
+        it has changed on Echo Mobile.
+
         :return: List of available accounts.
         :rtype: list
         """
+        if self._cache_is_fresh(self._accounts_cache, self._accounts_cache_time):
+            return self._accounts_cache
+
         self.log_start("Fetching user's accounts... ")
 
-        request = self.session.get(self.BASE_URL + "cms/account/me", params={"with_linked": 1})
-        response = request.json()
+        request = self.session.get(self._URL_ACCOUNTS, params={"with_linked": 1},
+                                   headers=self._conditional_headers(self._accounts_cache, self._accounts_etag))
 
-        if not response["success"]:
-            raise EchoMobileError(response["message"])
+        if request.status_code == 304:
+            self._accounts_cache_time = time.monotonic()
+            self.log_done()
+            return self._accounts_cache
+
+        response = self._check_response(request)
         self.log_done()
 
         self.log("  Accounts found for this user:")
         for account in response["linked"]:
             self.log("    " + account["ent_name"])
 
-        return response["linked"]
+        self._accounts_cache = response["linked"]
+        self._accounts_cache_time = time.monotonic()
+        self._accounts_etag = request.headers.get("ETag")
+        self._account_keys_by_name = self._keys_by_name(self._accounts_cache, "ent_name")
+
+        return self._accounts_cache
 
     def account_key_for_name(self, account_name):
         """
@@ -156,12 +384,14 @@ class EchoMobileSession(object):
         :return: Key for account with account_name
         :rtype: str
         """
-        matching_accounts = [account for account in self.accounts() if account["ent_name"] == account_name]
+        self.accounts()
+        matching_keys = self._account_keys_by_name.get(account_name)
 
-        if len(matching_accounts) == 0:
-            raise KeyError("Account with account_name '{}' not found".format(account_name))
+        if matching_keys is None:
+            raise KeyError("Account with account_name '{}' not found (Available accounts: {})".format(
+                account_name, ",".join(self._account_keys_by_name)))
 
-        account_key = matching_accounts[0]["key"]
+        account_key = matching_keys[0]
 
         self.log("Key for account '{}' is '{}'".format(account_name, account_key))
 
@@ -176,13 +406,13 @@ class EchoMobileSession(object):
         """
         self.log_start("Switching to account '{}'... ".format(account_key))
 
-        request = self.session.post(self.BASE_URL + "authenticate/linked", params={"acckey": account_key})
-        response = request.json()
-
-        if not response["success"]:
-            raise EchoMobileError(response["message"])
+        request = self.session.post(self._URL_AUTHENTICATE_LINKED, params={"acckey": account_key})
+        self._check_response(request)
         self.log_done()
 
+        # The surveys available depend on the account in use, so cached data is no longer valid.
+        self.clear_cache()
+
     def use_account_with_name(self, account_name):
         """
         Updates this session to use the account that has the given name.
@@ -195,20 +425,37 @@ class EchoMobileSession(object):
         self.use_account_with_key(self.account_key_for_name(account_name))
 
     def groups(self):
-        """Returns the list of groups available to the logged in user/account"""
+        """
+        Returns the list of groups available to the logged in user/account.
+
+        Results are cached for cache_ttl seconds. Once that time has passed, the list is only downloaded again if
+        it has changed on Echo Mobile.
+        """
+        if self._cache_is_fresh(self._groups_cache, self._groups_cache_time):
+            return self._groups_cache
+
         self.log_start("Fetching available groups... ")
 
-        request = self.session.get(self.BASE_URL + "cms/group")
-        response = request.json()
+        request = self.session.get(self._URL_GROUPS,
+                                   headers=self._conditional_headers(self._groups_cache, self._groups_etag))
 
-        if not response["success"]:
-            raise EchoMobileError(response["message"])
+        if request.status_code == 304:
+            self._groups_cache_time = time.monotonic()
+            self.log_done()
+            return self._groups_cache
+
+        response = self._check_response(request)
         self.log_done()
         self.log("  Groups found for this user/account:")
         for group in response["groups"]:
             self.log("    " + group["name"])
 
-        return response["groups"]
+        self._groups_cache = response["groups"]
+        self._groups_cache_time = time.monotonic()
+        self._groups_etag = request.headers.get("ETag")
+        self._group_keys_by_name = self._keys_by_name(self._groups_cache, "name")
+
+        return self._groups_cache
 
     def group_key_for_name(self, group_name):
         """
@@ -219,16 +466,17 @@ class EchoMobileSession(object):
         :return: Key of group
         :rtype: str
         """
-        groups = self.groups()
-        matching_groups = [g for g in groups if g["name"] == group_name]
+        self.groups()
+        matching_keys = self._group_keys_by_name.get(group_name)
 
-        if len(matching_groups) == 0:
+        if matching_keys is None:
             raise KeyError("Requested group not found on Echo Mobile (Available groups: " +
-                           ",".join(list(map(lambda g: g["name"], groups))) + ")")
+                           ",".join(self._group_keys_by_name) + ")")
 
-        assert len(matching_groups) == 1, "Multiple surveys with name " + group_name
+        if len(matching_keys) > 1:
+            raise EchoMobileError("Multiple groups with name '{}'".format(group_name))
 
-        group_key = matching_groups[0]["key"]
+        group_key = matching_keys[0]
 
         self.log("Key for group '{}' is '{}'".format(group_name, group_key))
 
@@ -237,21 +485,36 @@ class EchoMobileSession(object):
     def surveys(self):
         """
         Returns the list of active surveys available to the logged in user/account.
+
+        Results are cached for cache_ttl seconds. Once that time has passed, the list is only downloaded again if
+        it has changed on Echo Mobile.
         """
+        if self._cache_is_fresh(self._surveys_cache, self._surveys_cache_time):
+            return self._surveys_cache
+
         self.log_start("Fetching available surveys... ")
 
-        request = self.session.get(self.BASE_URL + "cms/survey")
-        response = request.json()
+        request = self.session.get(self._URL_SURVEYS,
+                                   headers=self._conditional_headers(self._surveys_cache, self._surveys_etag))
 
-        if not response["success"]:
-            raise EchoMobileError(response["message"])
+        if request.status_code == 304:
+            self._surveys_cache_time = time.monotonic()
+            self.log_done()
+            return self._surveys_cache
+
+        response = self._check_response(request)
         self.log_done()
 
         self.log("  Surveys found for this user/account:")
         for survey in response["surveys"]:
             self.log("    " + survey["name"])
 
-        return response["surveys"]
+        self._surveys_cache = response["surveys"]
+        self._surveys_cache_time = time.monotonic()
+        self._surveys_etag = request.headers.get("ETag")
+        self._survey_keys_by_name = self._keys_by_name(self._surveys_cache, "name")
+
+        return self._surveys_cache
 
     def survey_key_for_name(self, survey_name):
         """
@@ -262,57 +525,174 @@ class EchoMobileSession(object):
         :return: Key of survey
         :rtype: str
         """
-        surveys = self.surveys()
-        matching_surveys = [s for s in surveys if s["name"] == survey_name]
+        self.surveys()
+        matching_keys = self._survey_keys_by_name.get(survey_name)
 
-        if len(matching_surveys) == 0:
+        if matching_keys is None:
             raise KeyError("Requested survey not found on Echo Mobile (Available surveys: " +
-                           ",".join(list(map(lambda s: s["name"], surveys))) + ")")
+                           ",".join(self._survey_keys_by_name) + ")")
 
-        assert len(matching_surveys) == 1, "Multiple surveys with name " + survey_name
+        if len(matching_keys) > 1:
+            raise EchoMobileError("Multiple surveys with name '{}'".format(survey_name))
 
-        survey_key = matching_surveys[0]["key"]
+        survey_key = matching_keys[0]
 
         self.log("Key for survey '{}' is '{}'".format(survey_name, survey_key))
 
         return survey_key
 
-    def await_report_generated(self, report_key, poll_interval=2):
+    def background_tasks_status(self):
+        """
+        Returns the status of all the background tasks on Echo Mobile for the current account.
+
+        :return: Dictionary of task key -> task status. Task keys for reports are of the form "report_<report_key>".
+        :rtype: dict of str -> dict
+        """
+        # Task status is polled repeatedly while waiting for reports, so ask Echo Mobile to respond with
+        # '304 Not Modified' if nothing has changed since the last poll, rather than re-sending every task.
+        request = self.session.get(self._URL_BACKGROUND_TASKS,
+                                   headers=self._conditional_headers(self._tasks_cache, self._tasks_etag))
+
+        if request.status_code == 304:
+            return self._tasks_cache
+
+        response = self._check_response(request)
+
+        self._tasks_cache = response["tasks"]
+        self._tasks_etag = request.headers.get("ETag")
+
+        return self._tasks_cache
+
+    def await_report_generated(self, report_key, poll_interval=0.25, max_poll_interval=10, backoff_factor=1.5,
+                               jitter=0.1, max_missing_polls=10):
         """
         Polls Echo Mobile for the status of a report until it is marked as complete.
 
+        See await_reports_generated for details of the polling behaviour.
+
         :param report_key: Key of report to poll status of
         :type report_key: str
-        :param poll_interval: Time to wait between polling attempts, in seconds.
+        :param poll_interval: Time to wait after the first polling attempt, in seconds.
         :type poll_interval: float
+        :param max_poll_interval: Maximum time to wait between polling attempts, in seconds.
+        :type max_poll_interval: float
+        :param backoff_factor: Factor to multiply the time between polling attempts by after each attempt.
+        :type backoff_factor: float
+        :param jitter: Maximum fraction by which each wait is randomly lengthened or shortened, e.g. 0.1 for ±10%.
+        :type jitter: float
+        :param max_missing_polls: Number of consecutive polling attempts for which the report may be missing from
+                                  Echo Mobile's background tasks before giving up.
+        :type max_missing_polls: int
         """
-        self.log_start("Waiting for report to generate... ")
-
-        # Status is not documented, but from observation '1' means generating and '3' means successfully generated
-        report_status = 1
-        while report_status == 1:
-            time.sleep(poll_interval)
+        self.await_reports_generated([report_key], poll_interval=poll_interval, max_poll_interval=max_poll_interval,
+                                     backoff_factor=backoff_factor, jitter=jitter,
+                                     max_missing_polls=max_missing_polls)
 
-            request = self.session.get(self.BASE_URL + "cms/backgroundtask")
-            response = request.json()
+    def await_reports_generated(self, report_keys, poll_interval=0.25, max_poll_interval=10, backoff_factor=1.5,
+                                jitter=0.1, max_missing_polls=10):
+        """
+        Polls Echo Mobile for the status of multiple reports until they are all marked as complete.
 
-            if not response["success"]:
-                raise EchoMobileError(response["message"])
+        Echo Mobile returns the status of every background task in a single request, so each polling attempt
+        checks all of the reports at once.
 
-            task = response["tasks"]["report_" + report_key]
+        The first polling attempt is made immediately, so reports which are generated quickly are not delayed by
+        a wait. The time between subsequent polling attempts starts at poll_interval and is multiplied by
+        backoff_factor after each attempt, up to max_poll_interval. This means quick reports are detected as complete
+        soon after they finish, while long-running reports are not polled needlessly often. The wait is reset to
+        poll_interval whenever the reports' progress advances, and each wait is randomly jittered so that concurrent
+        sessions do not poll in lockstep.
 
-            if task["total"] != 0:
-                progress = task["progress"] / task["total"] * 100
-                self.log_progress("Waiting for report to generate... ", progress, end="", flush=True)
+        Reports which Echo Mobile has not listed as background tasks yet are treated as still generating, for up to
+        max_missing_polls consecutive polling attempts. This guards against waiting forever for e.g. a mistyped
+        report key, or a report belonging to a different account.
 
-            report_status = task["status"]
+        :param report_keys: Keys of reports to poll status of
+        :type report_keys: iterable of str
+        :param poll_interval: Time to wait after the first polling attempt, in seconds.
+        :type poll_interval: float
+        :param max_poll_interval: Maximum time to wait between polling attempts, in seconds.
+        :type max_poll_interval: float
+        :param backoff_factor: Factor to multiply the time between polling attempts by after each attempt.
+        :type backoff_factor: float
+        :param jitter: Maximum fraction by which each wait is randomly lengthened or shortened, e.g. 0.1 for ±10%.
+        :type jitter: float
+        :param max_missing_polls: Number of consecutive polling attempts for which a report may be missing from
+                                  Echo Mobile's background tasks before giving up.
+        :type max_missing_polls: int
+        :raises EchoMobileError: If a report stopped generating with a status other than success, or was still
+                                 missing from Echo Mobile's background tasks after max_missing_polls attempts.
+        """
+        task_keys = ["report_" + report_key for report_key in report_keys]
+        if len(task_keys) == 1:
+            message = "Waiting for report to generate... "
+        else:
+            message = "Waiting for {} reports to generate... ".format(len(task_keys))
+        self.log_start(message)
+
+        pending_task_keys = set(task_keys)
+        attempt = 0
+        missing_polls = 0
+        last_progress = None
+        last_percentage = None
+        while True:
+            tasks = self.background_tasks_status()
+
+            # Look up each task's fields once, in a single pass over the tasks.
+            progress = 0
+            total = 0
+            missing_task_keys = []
+            for task_key in task_keys:
+                task = tasks.get(task_key)
+                if task is None:
+                    # Echo Mobile may not have registered a task for a report it has only just started generating.
+                    if task_key in pending_task_keys:
+                        missing_task_keys.append(task_key)
+                    continue
+                progress += task["progress"]
+                total += task["total"]
+
+                if task_key in pending_task_keys:
+                    # Status is not documented, but from observation '1' means generating and '3' means
+                    # successfully generated
+                    status = task["status"]
+                    if status == 1:
+                        continue
+                    if status != 3:
+                        raise EchoMobileError("Report stopped generating, but with an unknown status ({})".format(
+                            status))
+                    pending_task_keys.remove(task_key)
+
+            if len(missing_task_keys) == 0:
+                missing_polls = 0
+            else:
+                missing_polls += 1
+                if missing_polls > max_missing_polls:
+                    raise EchoMobileError("Reports not listed by Echo Mobile after {} attempts: {}".format(
+                        missing_polls, ", ".join(sorted(missing_task_keys))))
+
+            if progress != last_progress:
+                attempt = 0
+                last_progress = progress
+
+            # Only print the progress when the whole percentage has changed, to avoid flushing stdout on every poll.
+            if self.verbose and total:
+                percentage = progress * 100 // total
+                if percentage != last_percentage:
+                    self.log_progress(message, percentage, end="", flush=True)
+                    last_percentage = percentage
+
+            if len(pending_task_keys) == 0:
+                break
+
+            wait = min(max_poll_interval, poll_interval * backoff_factor ** attempt)
+            time.sleep(wait * random.uniform(1 - jitter, 1 + jitter))
+            attempt += 1
 
         self.clear_progress()
-        self.log("Waiting for report to generate... ", end="", flush=True)
+        self.log(message, end="", flush=True)
         self.log_done()
 
-        assert report_status == 3, "Report stopped generating, but with an unknown status"
-
     def generate_messages_report(self, start_date, end_date, direction=None, wait_until_generated=True):
         """
         Starts the generation of a report containing all messages received by the current organisation within
@@ -323,7 +703,7 @@ class EchoMobileSession(object):
         :param end_date: Inclusive end date of message range to download. Must be in the format 'YYYY-MM-DD'.
         :type end_date: str
         :param direction: If not None, download only the messages in the specified direction.
-        :type direction: MessageDirection.value | None
+        :type direction: MessageDirection | None
         :param wait_until_generated: Whether to wait for the report to finish generating on the Echo Mobile server
                                      before returning.
         :type wait_until_generated: bool
@@ -334,7 +714,7 @@ class EchoMobileSession(object):
             "Requesting generation of report for all messages in range {} to {}... ".format(start_date, end_date))
 
         params = {
-            "type": ReportType.AllMessagesReport, "ftype": FileType.CSV,
+            "type": int(ReportType.AllMessagesReport), "ftype": int(FileType.CSV),
             "target": self.login_data["enterprise"]["key"],
             "additionalSpecs": "direction,channel,filter_type",
             "startDate": start_date, "endDate": end_date
@@ -342,17 +722,14 @@ class EchoMobileSession(object):
         
         if direction is not None:
             params["filter_type"] = "direction"
-            params["direction"] = direction
-
-        request = self.session.post(self.BASE_URL + "cms/report/generate", params=params)
-        response = request.json()
+            params["direction"] = int(direction)
 
-        if not response["success"]:
-            raise EchoMobileError(response["message"])
+        request = self.session.post(self._URL_GENERATE_REPORT, params=params)
+        response = self._check_response(request)
         self.log_done()
 
         report_key = response["rkey"]
-        self.background_tasks.add("report_" + report_key)
+        self._add_background_task("report_" + report_key)
 
         if wait_until_generated:
             self.await_report_generated(report_key)
@@ -382,34 +759,33 @@ class EchoMobileSession(object):
         :rtype: str
         """
         if contact_fields is None:
-            contact_fields = ["group", "upload_date"]
+            std_field = self._DEFAULT_INBOX_CONTACT_FIELDS
+        else:
+            std_field = ",".join(contact_fields)
 
         if group_key is None:
             self.log_start("Requesting generation of report for global inbox... ")
 
-            request = self.session.post(self.BASE_URL + "cms/report/generate",
+            request = self.session.post(self._URL_GENERATE_REPORT,
                                         params={
-                                            "type": ReportType.SearchReport, "ftype": FileType.CSV,
-                                            "std_field": ",".join(contact_fields)
+                                            "type": int(ReportType.SearchReport), "ftype": int(FileType.CSV),
+                                            "std_field": std_field
                                         })
         else:
             self.log_start("Requesting generation of report for inbox '{}'... ".format(group_key))
 
-            request = self.session.post(self.BASE_URL + "cms/report/generate",
+            request = self.session.post(self._URL_GENERATE_REPORT,
                                         params={
-                                            "type": ReportType.InboxReport, "ftype": FileType.CSV,
+                                            "type": int(ReportType.InboxReport), "ftype": int(FileType.CSV),
                                             "target": group_key,
-                                            "std_field": ",".join(contact_fields)
+                                            "std_field": std_field
                                         })
 
-        response = request.json()
-
-        if not response["success"]:
-            raise EchoMobileError(response["message"])
+        response = self._check_response(request)
         self.log_done()
 
         report_key = response["rkey"]
-        self.background_tasks.add("report_" + report_key)
+        self._add_background_task("report_" + report_key)
 
         if wait_until_generated:
             if group_key is None:
@@ -443,34 +819,35 @@ class EchoMobileSession(object):
         :rtype: str
         """
         if response_formats is None:
-            response_formats = ["raw", "label"]
+            gen = self._DEFAULT_SURVEY_RESPONSE_FORMATS
+        else:
+            gen = ",".join(response_formats)
         if contact_fields is None:
-            contact_fields = ["name", "phone"]
+            std_field = self._DEFAULT_SURVEY_CONTACT_FIELDS
+        else:
+            std_field = ",".join(contact_fields)
 
         self.log_start("Requesting generation of report for survey '{}'... ".format(survey_key))
 
-        request = self.session.post(self.BASE_URL + "cms/report/generate",
-                                    params={"type": ReportType.SurveyReport, "ftype": FileType.CSV,
+        request = self.session.post(self._URL_GENERATE_REPORT,
+                                    params={"type": int(ReportType.SurveyReport), "ftype": int(FileType.CSV),
                                             "target": survey_key,
-                                            "gen": ",".join(response_formats),
-                                            "std_field": ",".join(contact_fields)
+                                            "gen": gen,
+                                            "std_field": std_field
                                             }
                                     )
-        response = request.json()
-
-        if not response["success"]:
-            raise EchoMobileError(response["message"])
+        response = self._check_response(request)
         self.log_done()
 
         report_key = response["rkey"]
-        self.background_tasks.add("report_" + report_key)
+        self._add_background_task("report_" + report_key)
 
         if wait_until_generated:
             self.await_report_generated(report_key)
 
         return report_key
 
-    def download_report(self, report_key):
+    def download_report(self, report_key, file_path=None):
         """
         Downloads the specified report from Echo Mobile.
 
@@ -478,19 +855,74 @@ class EchoMobileSession(object):
 
         :param report_key: Key of report to download
         :type report_key: str
-        :return: CSV containing the survey report
-        :rtype: str
+        :param file_path: If not None, streams the report directly to a file at this path instead of returning it.
+        :type file_path: str | None
+        :return: CSV containing the survey report, or None if file_path was provided
+        :rtype: str | None
         """
+        if file_path is not None:
+            self.download_report_to_file(report_key, file_path)
+            return None
+
         self.log_start("Downloading report... ")
 
-        request = self.session.get(self.BASE_URL + "cms/report/serve", params={"rkey": report_key})
+        request = self.session.get(self._URL_SERVE_REPORT, params={"rkey": report_key})
+        request.raise_for_status()
+        # Echo Mobile exports are UTF-8, but are not always served with a charset. Without one, requests assumes
+        # ISO-8859-1 for text responses, which garbles non-ASCII text, or otherwise guesses the encoding by running
+        # character detection over the entire report, which is very slow for large reports.
+        request.encoding = "utf-8"
         response = request.text
 
         self.log_done()
 
         return response
 
-    def messages_report(self, start_date, end_date, direction=None):
+    def download_report_to_file(self, report_key, file_path, chunk_size=1 << 16):
+        """
+        Downloads the specified report from Echo Mobile, streaming it directly to a file.
+
+        Unlike download_report, this does not hold the entire report in memory.
+
+        Note that reports must first be generated before they can be downloaded.
+
+        :param report_key: Key of report to download
+        :type report_key: str
+        :param file_path: Path to the file to write the report to
+        :type file_path: str
+        :param chunk_size: Number of bytes to read from the network at a time
+        :type chunk_size: int
+        """
+        self.log_start("Downloading report to '{}'... ".format(file_path))
+
+        with self.session.get(self._URL_SERVE_REPORT, params={"rkey": report_key}, stream=True) as request:
+            request.raise_for_status()
+            with open(file_path, "wb") as f:
+                for chunk in request.iter_content(chunk_size):
+                    f.write(chunk)
+
+        self.log_done()
+
+    def download_reports(self, report_keys, max_workers=8):
+        """
+        Waits for each of the specified reports to finish generating, then downloads them all concurrently.
+
+        This allows reports of any type to be generated in parallel, by calling the generate_*_report methods with
+        wait_until_generated=False and then passing the returned keys to this method.
+
+        :param report_keys: Keys of reports to download
+        :type report_keys: list of str
+        :param max_workers: Maximum number of reports to download from Echo Mobile concurrently.
+        :type max_workers: int
+        :return: CSVs containing the reports, in the same order as report_keys
+        :rtype: list of str
+        """
+        self.await_reports_generated(report_keys)
+
+        with ThreadPoolExecutor(max_workers=max_workers) as executor:
+            return list(executor.map(self.download_report, report_keys))
+
+    def messages_report(self, start_date, end_date, direction=None, file_path=None):
         """
         Generates and downloads a report for all messages in the current account which were sent/received
         within the specified time range.
@@ -500,14 +932,17 @@ class EchoMobileSession(object):
         :param end_date: Inclusive end date of message range to download. Must be in the format 'YYYY-MM-DD'.
         :type end_date: str
         :param direction: If not None, download only the messages in the specified direction.
-        :type direction: MessageDirection.value | None
-        :return: CSV containing the messages report
-        :rtype: str
+        :type direction: MessageDirection | None
+        :param file_path: If not None, streams the report directly to a file at this path instead of returning it.
+        :type file_path: str | None
+        :return: CSV containing the messages report, or None if file_path was provided
+        :rtype: str | None
         """
         return self.download_report(
-            self.generate_messages_report(start_date, end_date, direction, wait_until_generated=True))
+            self.generate_messages_report(start_date, end_date, direction, wait_until_generated=True),
+            file_path=file_path)
 
-    def global_inbox_report(self, contact_fields=None):
+    def global_inbox_report(self, contact_fields=None, file_path=None):
         """
         Generates and downloads a report for the current account's global inbox.
 
@@ -517,13 +952,15 @@ class EchoMobileSession(object):
                                The full list of options is: internal_id, group, referrer, upload_date,
                                last_survey_complete_date, geo, locationTextRaw, labels
         :type contact_fields: list of str
-        :return: CSV containing the inbox report
-        :rtype: str
+        :param file_path: If not None, streams the report directly to a file at this path instead of returning it.
+        :type file_path: str | None
+        :return: CSV containing the inbox report, or None if file_path was provided
+        :rtype: str | None
         """
         return self.download_report(
-            self.generate_inbox_report(contact_fields=contact_fields, wait_until_generated=True))
+            self.generate_inbox_report(contact_fields=contact_fields, wait_until_generated=True), file_path=file_path)
 
-    def group_inbox_report_for_key(self, group_key, contact_fields=None):
+    def group_inbox_report_for_key(self, group_key, contact_fields=None, file_path=None):
         """
         Generates and downloads an inbox report for the group with the given key.
 
@@ -535,14 +972,16 @@ class EchoMobileSession(object):
                                The full list of options is: internal_id, group, referrer, upload_date,
                                last_survey_complete_date, geo, locationTextRaw, labels
         :type contact_fields: list of str
-        :return: CSV containing the inbox report
-        :rtype: str
+        :param file_path: If not None, streams the report directly to a file at this path instead of returning it.
+        :type file_path: str | None
+        :return: CSV containing the inbox report, or None if file_path was provided
+        :rtype: str | None
         """
         report_key = self.generate_inbox_report(group_key=group_key,
                                                 contact_fields=contact_fields, wait_until_generated=True)
-        return self.download_report(report_key)
+        return self.download_report(report_key, file_path=file_path)
 
-    def group_inbox_report_for_name(self, group_name, contact_fields=None):
+    def group_inbox_report_for_name(self, group_name, contact_fields=None, file_path=None):
         """
         Generates and downloads an inbox report for the group with the given name.
 
@@ -554,12 +993,15 @@ class EchoMobileSession(object):
                                The full list of options is: internal_id, group, referrer, upload_date,
                                last_survey_complete_date, geo, locationTextRaw, labels
         :type contact_fields: list of str
-        :return: CSV containing the inbox report
-        :rtype: str
+        :param file_path: If not None, streams the report directly to a file at this path instead of returning it.
+        :type file_path: str | None
+        :return: CSV containing the inbox report, or None if file_path was provided
+        :rtype: str | None
         """
-        return self.group_inbox_report_for_key(self.group_key_for_name(group_name), contact_fields=contact_fields)
+        return self.group_inbox_report_for_key(self.group_key_for_name(group_name), contact_fields=contact_fields,
+                                               file_path=file_path)
 
-    def inbox_report(self, group_name=None, contact_fields=None):
+    def inbox_report(self, group_name=None, contact_fields=None, file_path=None):
         """
         Generates and downloads an inbox report.
 
@@ -571,15 +1013,17 @@ class EchoMobileSession(object):
                                The full list of options is: internal_id, group, referrer, upload_date,
                                last_survey_complete_date, geo, locationTextRaw, labels
         :type contact_fields: list of str
-        :return: CSV containing the inbox report
-        :rtype: str
+        :param file_path: If not None, streams the report directly to a file at this path instead of returning it.
+        :type file_path: str | None
+        :return: CSV containing the inbox report, or None if file_path was provided
+        :rtype: str | None
         """
         if group_name is None:
-            return self.global_inbox_report(contact_fields=contact_fields)
+            return self.global_inbox_report(contact_fields=contact_fields, file_path=file_path)
         else:
-            return self.group_inbox_report_for_name(group_name, contact_fields=contact_fields)
+            return self.group_inbox_report_for_name(group_name, contact_fields=contact_fields, file_path=file_path)
 
-    def survey_report_for_key(self, survey_key, contact_fields=None, response_formats=None):
+    def survey_report_for_key(self, survey_key, contact_fields=None, response_formats=None, file_path=None):
         """
         Generates and downloads a report for the survey with the given key.
 
@@ -593,14 +1037,16 @@ class EchoMobileSession(object):
                                upload_date, last_survey_complete_date, geo, locationTextRaw, labels, linked_entity,
                                opted_out.
         :type contact_fields: list of str
-        :return: CSV containing the survey report
-        :rtype: str
+        :param file_path: If not None, streams the report directly to a file at this path instead of returning it.
+        :type file_path: str | None
+        :return: CSV containing the survey report, or None if file_path was provided
+        :rtype: str | None
         """
         report_key = self.generate_survey_report(survey_key, contact_fields=contact_fields,
                                                  response_formats=response_formats, wait_until_generated=True)
-        return self.download_report(report_key)
+        return self.download_report(report_key, file_path=file_path)
 
-    def survey_report_for_name(self, survey_name, contact_fields=None, response_formats=None):
+    def survey_report_for_name(self, survey_name, contact_fields=None, response_formats=None, file_path=None):
         """
         Generates and downloads a report for the survey with the given name.
 
@@ -614,11 +1060,73 @@ class EchoMobileSession(object):
                                upload_date, last_survey_complete_date, geo, locationTextRaw, labels, linked_entity,
                                opted_out.
         :type contact_fields: list of str
-        :return: CSV containing the survey report
-        :rtype: str
+        :param file_path: If not None, streams the report directly to a file at this path instead of returning it.
+        :type file_path: str | None
+        :return: CSV containing the survey report, or None if file_path was provided
+        :rtype: str | None
         """
         return self.survey_report_for_key(self.survey_key_for_name(survey_name), contact_fields=contact_fields,
-                                          response_formats=response_formats)
+                                          response_formats=response_formats, file_path=file_path)
+
+    def survey_reports_for_keys(self, survey_keys, contact_fields=None, response_formats=None, max_workers=8):
+        """
+        Generates and downloads reports for each of the surveys with the given keys.
+
+        All of the reports are requested concurrently, before waiting for any of them to finish generating, so that
+        Echo Mobile generates them concurrently. The completed reports are then downloaded concurrently.
+
+        :param survey_keys: Keys of surveys to generate and download reports for
+        :type survey_keys: list of str
+        :param response_formats: List of response formats to download. Defaults to ["raw", "label"] if None.
+                                 The full list of options is : raw, label, value, score.
+        :type response_formats: list of str
+        :param contact_fields: List of contact fields to download. Defaults to ["name", "phone"] if None.
+                               The full list of options is: name, phone, internal_id, group, referrer, referrer_phone,
+                               upload_date, last_survey_complete_date, geo, locationTextRaw, labels, linked_entity,
+                               opted_out.
+        :type contact_fields: list of str
+        :param max_workers: Maximum number of requests to make to Echo Mobile concurrently.
+        :type max_workers: int
+        :return: CSVs containing the survey reports, in the same order as survey_keys
+        :rtype: list of str
+        """
+        def generate_report(survey_key):
+            return self.generate_survey_report(survey_key, contact_fields=contact_fields,
+                                               response_formats=response_formats, wait_until_generated=False)
+
+        with ThreadPoolExecutor(max_workers=max_workers) as executor:
+            report_keys = list(executor.map(generate_report, survey_keys))
+
+        return self.download_reports(report_keys, max_workers=max_workers)
+
+    def survey_reports_for_names(self, survey_names, contact_fields=None, response_formats=None, max_workers=8):
+        """
+        Generates and downloads reports for each of the surveys with the given names.
+
+        See survey_reports_for_keys for details.
+
+        :param survey_names: Names of surveys to generate and download reports for
+        :type survey_names: list of str
+        :param response_formats: List of response formats to download. Defaults to ["raw", "label"] if None.
+                                 The full list of options is : raw, label, value, score.
+        :type response_formats: list of str
+        :param contact_fields: List of contact fields to download. Defaults to ["name", "phone"] if None.
+                               The full list of options is: name, phone, internal_id, group, referrer, referrer_phone,
+                               upload_date, last_survey_complete_date, geo, locationTextRaw, labels, linked_entity,
+                               opted_out.
+        :type contact_fields: list of str
+        :param max_workers: Maximum number of requests to make to Echo Mobile concurrently.
+        :type max_workers: int
+        :return: CSVs containing the survey reports, in the same order as survey_names
+        :rtype: list of str
+        """
+        survey_keys = [self.survey_key_for_name(survey_name) for survey_name in survey_names]
+        return self.survey_reports_for_keys(survey_keys, contact_fields=contact_fields,
+                                            response_formats=response_formats, max_workers=max_workers)
+
+    def _add_background_task(self, task_key):
+        with self._background_tasks_lock:
+            self.background_tasks.add(task_key)
 
     def delete_background_task(self, task_key):
         """
@@ -629,20 +1137,149 @@ class EchoMobileSession(object):
         """
         self.log_start("Deleting background task '{}'... ".format(task_key))
 
-        request = self.session.post(self.BASE_URL + "cms/backgroundtask/cancel", params={"key": task_key})
-        response = request.json()
-
-        if not response["success"]:
-            raise EchoMobileError(response["message"])
+        request = self.session.post(self._URL_CANCEL_BACKGROUND_TASK, params={"key": task_key})
+        self._check_response(request)
         self.log_done()
 
-    def delete_session_background_tasks(self):
+    def delete_session_background_tasks(self, max_workers=8, parallel=True):
         """
         Deletes all the background tasks on Echo Mobile which have been generated by this session so far.
+
+        Deletion is attempted for every task, even if deleting some of them fails. Tasks which could not be deleted
+        remain in background_tasks, and the first error encountered is raised once all the attempts are complete.
+
+        :param max_workers: Maximum number of delete requests to make to Echo Mobile concurrently.
+        :type max_workers: int
+        :param parallel: Whether to make the delete requests concurrently. Set to False to delete the tasks one at a
+                         time on the calling thread, e.g. at interpreter shutdown, when new threads cannot be started.
+        :type parallel: bool
+        """
+        # Take ownership of the current tasks up-front, so that tasks added by other threads while these are being
+        # deleted are not lost, and concurrent calls to this method do not try to delete the same tasks.
+        with self._background_tasks_lock:
+            keys = list(self.background_tasks)
+            self.background_tasks.clear()
+
+        if not parallel:
+            errors = []
+            for key in keys:
+                try:
+                    self.delete_background_task(key)
+                except Exception as error:
+                    self._add_background_task(key)
+                    errors.append(error)
+
+            if len(errors) > 0:
+                raise errors[0]
+            return
+
+        futures = dict()
+        try:
+            with ThreadPoolExecutor(max_workers=max_workers) as executor:
+                for key in keys:
+                    futures[key] = executor.submit(self.delete_background_task, key)
+        finally:
+            # Keep hold of any tasks whose deletion could not be scheduled (e.g. because the executor refused more
+            # work), so that they can still be deleted by a later call.
+            for key in keys:
+                if key not in futures:
+                    self._add_background_task(key)
+
+        errors = []
+        for key, future in futures.items():
+            error = future.exception()
+            if error is not None:
+                self._add_background_task(key)
+                errors.append(error)
+
+        if len(errors) > 0:
+            raise errors[0]
+
+    def close(self, parallel=True):
+        """
+        Deletes all the background tasks generated by this session, then closes the session's connections to
+        Echo Mobile.
+
+        The connections are closed even if deleting the background tasks fails.
+
+        :param parallel: Whether to delete the background tasks concurrently.
+                         See delete_session_background_tasks.
+        :type parallel: bool
+        """
+        try:
+            self.delete_session_background_tasks(parallel=parallel)
+        finally:
+            self.session.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+
+    def _login_timezone(self):
+        """
+        Returns the timezone presented by Echo Mobile when the user logged in.
+
+        The timezone is looked up once and re-used until login_data changes to a different timezone, because
+        this is called for every date converted.
+
+        :return: Timezone of the logged in user.
+        :rtype: pytz.tzfile
+        :raises NoSessionDataError:
         """
-        for key in list(self.background_tasks):
-            self.delete_background_task(key)
-            self.background_tasks.remove(key)
+        if self.login_data is None:
+            raise NoSessionDataError()
+
+        tz_name = self.login_data["tz"]
+        if self._timezone is None or self._timezone.zone != tz_name:
+            self._timezone = pytz.timezone(tz_name)
+        return self._timezone
+
+    def echo_mobile_date_to_datetime(self, date, timezone=None):
+        """
+        Converts a date from one of Echo Mobile's export formats to a timezone-aware datetime.
+
+        >>> dt = EchoMobileSession().echo_mobile_date_to_datetime("2018-06-01 19:20", pytz.timezone("Africa/Nairobi"))
+        >>> dt.year, dt.month, dt.day, dt.hour, dt.minute, dt.utcoffset().total_seconds()
+        (2018, 6, 1, 19, 20, 10800.0)
+
+        Strings ending EAT are interpreted as UTC+3.
+        No other endings are supported.
+
+        :param date: String in the format 'YY-MM-DD hh:mm'
+        :type date: str
+        :param timezone: Timezone to interpret date in.
+                         If None, uses Africa/Nairobi if the string ends with ' EAT', otherwise
+                         uses the timezone information presented by Echo Mobile when the user logged in.
+        :type timezone: pytz.tzfile
+        :return: Timezone-aware datetime
+        :rtype: datetime
+        :raises NoSessionDataError:
+        """
+        if date.endswith(" EAT"):
+            if timezone is None:
+                timezone = _EAT
+            date = date[:-4]
+
+        # Parse date into a datetime object. Dates are almost always exactly in the format 'YYYY-MM-DD hh:mm', so
+        # parse the fields by position, which is much faster than strptime when converting every row of a report.
+        # Fall back to strptime for anything else, so that unexpected formats are still handled or reported.
+        # The fields must be checked to be digits, because int() also accepts signs, underscores, and whitespace.
+        if (len(date) == 16 and date[4] == "-" and date[7] == "-" and date[10] == " " and date[13] == ":" and
+                (date[0:4] + date[5:7] + date[8:10] + date[11:13] + date[14:16]).isdigit()):
+            try:
+                parsed = datetime(int(date[0:4]), int(date[5:7]), int(date[8:10]), int(date[11:13]), int(date[14:16]))
+            except ValueError:
+                parsed = datetime.strptime(date, "%Y-%m-%d %H:%M")
+        else:
+            parsed = datetime.strptime(date, "%Y-%m-%d %H:%M")
+
+        if timezone is None:
+            timezone = self._login_timezone()
+
+        # Use timezone.localize because pytz is incompatible with datetime.replace(tzinfo=...).
+        return timezone.localize(parsed)
 
     def echo_mobile_date_to_iso(self, date, timezone=None):
         """
@@ -667,21 +1304,7 @@ class EchoMobileSession(object):
         :rtype: str
         :raises NoSessionDataError:
         """
-        if date.endswith(" EAT"):
-            if timezone is None:
-                timezone = pytz.timezone("Africa/Nairobi")
-            date = date[:-4]
-
-        # Parse date into a datetime object.
-        parsed = datetime.strptime(date, "%Y-%m-%d %H:%M")
-
-        if timezone is None:
-            if self.login_data is None:
-                raise NoSessionDataError()
-            timezone = pytz.timezone(self.login_data["tz"])
-
-        # Use timezone.localize because pytz is incompatible with datetime.replace(tzinfo=...).
-        return timezone.localize(parsed).isoformat()
+        return self.echo_mobile_date_to_datetime(date, timezone).isoformat()
 
     def datetime_to_echo_mobile_datetime(self, dt):
         """
@@ -692,10 +1315,7 @@ class EchoMobileSession(object):
         :return: Localized datetime.
         :rtype: datetime
         """
-        if self.login_data is None:
-            raise NoSessionDataError()
-        timezone = pytz.timezone(self.login_data["tz"])
-        return dt.astimezone(timezone)
+        return dt.astimezone(self._login_timezone())
 
     @staticmethod
     def normalise_message(d, sender_key, date_key, message_key):
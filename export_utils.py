@@ -0,0 +1,75 @@
+import csv
+import os
+
+
+def read_report_rows(report_file, phone_column, identifying_columns=()):
+    """
+    Reads the rows of a CSV report exported by Echo Mobile, separating each row's phone number from the columns
+    to keep.
+
+    Rows are read as lists rather than with csv.DictReader, so that each row's dict is built once with only the
+    columns to keep, instead of being built, trimmed of the identifying columns, then copied. As with csv.DictReader,
+    blank lines are skipped, fields missing from rows which are shorter than the header are set to None, and any
+    extra fields in rows which are longer than the header are kept as a list under the key None.
+
+    >>> import io
+    >>> report = io.StringIO("Phone,Sender,Message\\r\\n+254700000000,Alice,Hello\\r\\n\\r\\n+254700000001\\r\\n")
+    >>> list(read_report_rows(report, "Phone", ["Sender"]))
+    [('+254700000000', {'Message': 'Hello'}), ('+254700000001', {'Message': None})]
+    >>> list(read_report_rows(io.StringIO("Phone,Message\\r\\n+254700000000,Hello,there,world\\r\\n"), "Phone"))
+    [('+254700000000', {'Message': 'Hello', None: ['there', 'world']})]
+
+    :param report_file: Report to read, opened in text mode with newline="".
+    :type report_file: file-like
+    :param phone_column: Name of the column which contains each row's phone number.
+    :type phone_column: str
+    :param identifying_columns: Names of any other columns to leave out of each row's dict.
+    :type identifying_columns: iterable of str
+    :return: Iterator of (phone number, dict of column name -> value) for each row of the report.
+    :rtype: iterator of (str | None, dict of (str | None) -> (str | None | list of str))
+    """
+    reader = csv.reader(report_file)
+    header = next(reader, None)
+    if header is None:
+        return  # The report is empty
+
+    excluded_columns = set(identifying_columns)
+    excluded_columns.add(phone_column)
+    phone_index = header.index(phone_column)
+    kept_columns = [(i, column) for i, column in enumerate(header) if column not in excluded_columns]
+
+    for row in reader:
+        if len(row) == 0:
+            continue  # Skip blank lines
+        if len(row) < len(header):
+            row += [None] * (len(header) - len(row))
+        d = {column: row[i] for i, column in kept_columns}
+        if len(row) > len(header):
+            d[None] = row[len(header):]
+        yield row[phone_index], d
+
+
+def dump_atomically(table, path):
+    """
+    Writes a UUID table to a file, replacing the file at that path only once the table has been written in full.
+
+    The table is written to a temporary file first and flushed to disk before it replaces the original, so that the
+    existing table is not lost if this process is interrupted, or the machine crashes, part way through writing.
+
+    :param table: Table to write, e.g. a PhoneNumberUuidTable or MessageUuidTable.
+    :type table: any object with a dump(f) method
+    :param path: Path of the file to write the table to.
+    :type path: str
+    """
+    temp_path = path + ".tmp"
+    try:
+        with open(temp_path, "w") as f:
+            table.dump(f)
+            f.flush()
+            os.fsync(f.fileno())
+    except BaseException:
+        # Don't leave a partially written table behind.
+        if os.path.exists(temp_path):
+            os.remove(temp_path)
+        raise
+    os.replace(temp_path, path)
@@ -1,20 +1,16 @@
 import argparse
+import functools
 import os
+import tempfile
 import time
-from io import StringIO
 
-import six
 from core_data_modules.traced_data import TracedData, Metadata
 from core_data_modules.traced_data.io import TracedDataJsonIO
 from core_data_modules.util import PhoneNumberUuidTable, MessageUuidTable
 from dateutil.parser import isoparse
 
 from echo_mobile_session import EchoMobileSession, MessageDirection
-
-if six.PY2:
-    import unicodecsv as csv
-if six.PY3:
-    import csv
+from export_utils import dump_atomically, read_report_rows
 
 if __name__ == "__main__":
     BASE_URL = "https://www.echomobile.org/api/"
@@ -64,55 +60,71 @@ if __name__ == "__main__":
         message_uuids = MessageUuidTable.load(f)
 
     session = EchoMobileSession(verbose=verbose_mode)
-    try:
-        # Download inbox report from Echo Mobile.
-        session.login(echo_mobile_username, echo_mobile_password)
-        session.use_account_with_name(account_name)
-
-        # Convert start/end dates into an Echo Mobile time zone.
-        echo_mobile_start_date = session.datetime_to_echo_mobile_datetime(user_start_date)
-        echo_mobile_end_date = session.datetime_to_echo_mobile_datetime(user_end_date)
-
-        report = session.messages_report(
-            echo_mobile_start_date.strftime("%Y-%m-%d"), echo_mobile_end_date.strftime("%Y-%m-%d"),
-            direction=MessageDirection.Incoming)
-    finally:
-        # Delete the background task we made when generating the report
-        session.delete_session_background_tasks()
-
-    # Parse the downloaded report into a list of TracedData objects, de-identifying in the process.
-    messages = []
-    for row in csv.DictReader(StringIO(report)):
-        row["avf_phone_id"] = phone_uuids.add_phone(row["Phone"])
-        del row["Phone"]
-        messages.append(TracedData(dict(row), Metadata(user, Metadata.get_call_location(), time.time())))
+    with tempfile.TemporaryDirectory() as report_dir:
+        # Stream the report to a temporary file rather than holding it in memory while it is being parsed.
+        report_path = os.path.join(report_dir, "report.csv")
+        try:
+            # Download inbox report from Echo Mobile.
+            session.login(echo_mobile_username, echo_mobile_password)
+            session.use_account_with_name(account_name)
+
+            # Convert start/end dates into an Echo Mobile time zone.
+            echo_mobile_start_date = session.datetime_to_echo_mobile_datetime(user_start_date)
+            echo_mobile_end_date = session.datetime_to_echo_mobile_datetime(user_end_date)
+
+            session.messages_report(
+                echo_mobile_start_date.strftime("%Y-%m-%d"), echo_mobile_end_date.strftime("%Y-%m-%d"),
+                direction=MessageDirection.Incoming, file_path=report_path)
+        finally:
+            # Delete the background task we made when generating the report
+            session.delete_session_background_tasks()
+
+        # Reports contain many rows with the same date, so only convert and range-check each distinct date once.
+        echo_mobile_date_to_iso = functools.lru_cache(maxsize=4096)(session.echo_mobile_date_to_iso)
+
+        @functools.lru_cache(maxsize=4096)
+        def in_date_range(echo_mobile_date):
+            return echo_mobile_start_date <= session.echo_mobile_date_to_datetime(echo_mobile_date) < \
+                echo_mobile_end_date
+
+        # Parse the downloaded report into a list of TracedData objects, de-identifying in the process.
+        messages = []
+        # Every row is imported by the same step, so share one Metadata rather than inspecting the call stack
+        # for every row.
+        metadata = Metadata(user, Metadata.get_call_location(), time.time())
+        with open(report_path, "r", encoding="utf-8", newline="") as f:
+            for phone, d in read_report_rows(f, "Phone"):
+                # Echo Mobile only filters reports by day, so filter out messages sent outwith the desired time
+                # range here, before doing any other work on them.
+                if not in_date_range(d["Date"]):
+                    continue
+                d["avf_phone_id"] = phone_uuids.add_phone(phone)
+                messages.append(TracedData(d, metadata))
 
     # Convert times to ISO
+    metadata = Metadata(user, Metadata.get_call_location(), time.time())
     for td in messages:
         td.append_data(
-            {"Date": session.echo_mobile_date_to_iso(td["Date"])},
-            Metadata(user, Metadata.get_call_location(), time.time())
+            {"Date": echo_mobile_date_to_iso(td["Date"])},
+            metadata
         )
 
-    # Filter out messages sent outwith the desired time range.
-    messages = list(filter(lambda td: echo_mobile_start_date <= isoparse(td["Date"]) < echo_mobile_end_date, messages))
-
     # Add a unique id to each message
+    metadata = Metadata(user, Metadata.get_call_location(), time.time())
     for td in messages:
         td.append_data(
             {"avf_message_id": message_uuids.add_message(
                 EchoMobileSession.normalise_message(td, "avf_phone_id", "Date", "Message"))},
-            Metadata(user, Metadata.get_call_location(), time.time())
+            metadata
         )
 
     # Write the UUIDs out to a file
-    with open(phone_uuid_path, "w") as f:
-        phone_uuids.dump(f)
-    with open(message_uuid_path, "w") as f:
-        message_uuids.dump(f)
+    dump_atomically(phone_uuids, phone_uuid_path)
+    dump_atomically(message_uuids, message_uuid_path)
 
     # Write the parsed messages to a json file
-    if os.path.dirname(json_output_path) is not "" and not os.path.exists(os.path.dirname(json_output_path)):
-        os.makedirs(os.path.dirname(json_output_path))
+    json_output_dir = os.path.dirname(json_output_path)
+    if json_output_dir != "":
+        os.makedirs(json_output_dir, exist_ok=True)
     with open(json_output_path, "w") as f:
         TracedDataJsonIO.export_traced_data_iterable_to_json(messages, f, pretty_print=True)
@@ -1,19 +1,15 @@
 import argparse
+import functools
 import os
+import tempfile
 import time
-from io import StringIO
 
-import six
 from core_data_modules.traced_data import TracedData, Metadata
 from core_data_modules.traced_data.io import TracedDataJsonIO
 from core_data_modules.util import PhoneNumberUuidTable
 
 from echo_mobile_session import EchoMobileSession
-
-if six.PY2:
-    import unicodecsv as csv
-if six.PY3:
-    import csv
+from export_utils import dump_atomically, read_report_rows
 
 if __name__ == "__main__":
     BASE_URL = "https://www.echomobile.org/api/"
@@ -46,40 +42,47 @@ if __name__ == "__main__":
         phone_uuids = PhoneNumberUuidTable.load(f)
 
     session = EchoMobileSession(verbose=verbose_mode)
-    try:
-        # Download survey report from Echo Mobile
-        session.login(echo_mobile_username, echo_mobile_password)
-        session.use_account_with_name(account_name)
-        report = session.survey_report_for_name(survey_name)
-    finally:
-        session.delete_session_background_tasks()
+    with tempfile.TemporaryDirectory() as report_dir:
+        # Stream the report to a temporary file rather than holding it in memory while it is being parsed.
+        report_path = os.path.join(report_dir, "report.csv")
+        try:
+            # Download survey report from Echo Mobile
+            session.login(echo_mobile_username, echo_mobile_password)
+            session.use_account_with_name(account_name)
+            session.survey_report_for_name(survey_name, file_path=report_path)
+        finally:
+            session.delete_session_background_tasks()
 
-    # Parse the downloaded report into a list of TracedData objects, de-identifying in the process.
-    data = []
-    for row in csv.DictReader(StringIO(report)):
-        row["avf_phone_id"] = phone_uuids.add_phone(row["phone"])
-        del row["phone"]
-        del row["name"]
-        data.append(TracedData(dict(row), Metadata(user, Metadata.get_call_location(), time.time())))
+        # Parse the downloaded report into a list of TracedData objects, de-identifying in the process.
+        data = []
+        # Every row is imported by the same step, so share one Metadata rather than inspecting the call stack
+        # for every row.
+        metadata = Metadata(user, Metadata.get_call_location(), time.time())
+        with open(report_path, "r", encoding="utf-8", newline="") as f:
+            for phone, d in read_report_rows(f, "phone", ["name"]):
+                d["avf_phone_id"] = phone_uuids.add_phone(phone)
+                data.append(TracedData(d, metadata))
 
-    # Convert times to ISO
+    # Convert times to ISO. Reports contain many rows with the same date, so only convert each distinct date once.
+    echo_mobile_date_to_iso = functools.lru_cache(maxsize=4096)(session.echo_mobile_date_to_iso)
+    metadata = Metadata(user, Metadata.get_call_location(), time.time())
     for td in data:
         td.append_data(
             {
-                "invited_date": session.echo_mobile_date_to_iso(td["invite_date"]),
-                "start_date": session.echo_mobile_date_to_iso(td["start_date"]),
+                "invited_date": echo_mobile_date_to_iso(td["invite_date"]),
+                "start_date": echo_mobile_date_to_iso(td["start_date"]),
                 "complete_date":
-                    None if td["complete_date"] == "" else session.echo_mobile_date_to_iso(td["complete_date"])
+                    None if td["complete_date"] == "" else echo_mobile_date_to_iso(td["complete_date"])
             },
-            Metadata(user, Metadata.get_call_location(), time.time())
+            metadata
         )
 
     # Write the UUIDs out to a file
-    with open(phone_uuid_path, "w") as f:
-        phone_uuids.dump(f)
+    dump_atomically(phone_uuids, phone_uuid_path)
 
     # Write the parsed items to a json file
-    if os.path.dirname(json_output_path) is not "" and not os.path.exists(os.path.dirname(json_output_path)):
-        os.makedirs(os.path.dirname(json_output_path))
+    json_output_dir = os.path.dirname(json_output_path)
+    if json_output_dir != "":
+        os.makedirs(json_output_dir, exist_ok=True)
     with open(json_output_path, "w") as f:
         TracedDataJsonIO.export_traced_data_iterable_to_json(data, f, pretty_print=True)
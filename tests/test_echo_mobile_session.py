@@ -1,12 +1,28 @@
+import json
+import os
+import tempfile
+import threading
+import time
 import unittest
+from unittest import mock
 
 import pytz
+import requests
 from dateutil.parser import isoparse
 
-from echo_mobile_session import EchoMobileSession, NoSessionDataError
+from echo_mobile_session import EchoMobileSession, EchoMobileError, NoSessionDataError
 
 
 class TestEchoMobileSession(unittest.TestCase):
+    @staticmethod
+    def mock_response(body, status_code=200, headers=None):
+        response = mock.Mock()
+        response.status_code = status_code
+        response.headers = dict() if headers is None else headers
+        response.json.return_value = body
+        response.content = json.dumps(body).encode("utf-8")
+        return response
+
     def test_echo_mobile_date_to_iso(self):
         session = EchoMobileSession()
 
@@ -101,3 +117,379 @@ class TestEchoMobileSession(unittest.TestCase):
             EchoMobileSession.normalise_message(
                 input_message, sender_key="phone", date_key="date-time", message_key="msg")
         )
+
+    def test_survey_key_for_name_caches_surveys(self):
+        session = EchoMobileSession()
+        session.session = mock.Mock()
+        session.session.get.return_value = self.mock_response({
+            "success": True,
+            "surveys": [{"name": "Survey A", "key": "key-a"}, {"name": "Survey B", "key": "key-b"}]
+        })
+
+        self.assertEqual(session.survey_key_for_name("Survey A"), "key-a")
+        self.assertEqual(session.survey_key_for_name("Survey B"), "key-b")
+        self.assertRaises(KeyError, lambda: session.survey_key_for_name("Survey C"))
+
+        # The list of surveys should only have been fetched from Echo Mobile once.
+        self.assertEqual(session.session.get.call_count, 1)
+
+        # Clearing the cache should cause the surveys to be fetched again.
+        session.clear_cache()
+        self.assertEqual(session.survey_key_for_name("Survey A"), "key-a")
+        self.assertEqual(session.session.get.call_count, 2)
+
+    def test_survey_key_for_duplicate_name(self):
+        session = EchoMobileSession()
+        session.session = mock.Mock()
+        session.session.get.return_value = self.mock_response({
+            "success": True,
+            "surveys": [{"name": "Survey A", "key": "key-a"}, {"name": "Survey A", "key": "key-a-2"},
+                        {"name": "Survey B", "key": "key-b"}]
+        })
+
+        self.assertRaises(EchoMobileError, lambda: session.survey_key_for_name("Survey A"))
+        self.assertEqual(session.survey_key_for_name("Survey B"), "key-b")
+
+    def test_login_clears_cache(self):
+        session = EchoMobileSession()
+        session.session = mock.Mock()
+        session.session.post.return_value = self.mock_response({"success": True, "tz": "UTC"})
+        session.session.get.side_effect = [
+            self.mock_response({"success": True, "surveys": [{"key": "a", "name": "Survey"}]}),
+            self.mock_response({"success": True, "surveys": [{"key": "b", "name": "Survey"}]})
+        ]
+
+        session.login("user-a", "password")
+        self.assertEqual(session.survey_key_for_name("Survey"), "a")
+
+        # A different user must not see the surveys cached for the previous one.
+        session.login("user-b", "password")
+        self.assertEqual(session.survey_key_for_name("Survey"), "b")
+        self.assertEqual(session.session.get.call_count, 2)
+
+    def test_surveys_conditional_get(self):
+        session = EchoMobileSession(cache_ttl=0)
+        session.session = mock.Mock()
+        surveys = [{"name": "Survey A", "key": "key-a"}]
+        session.session.get.return_value = self.mock_response(
+            {"success": True, "surveys": surveys}, headers={"ETag": "etag-1"})
+
+        self.assertEqual(session.surveys(), surveys)
+        self.assertDictEqual(session.session.get.call_args[1]["headers"], dict())
+
+        # Once the cache has expired, the next request should ask whether the surveys have changed, and re-use the
+        # cached surveys if they have not.
+        session.session.get.return_value = self.mock_response(None, status_code=304)
+        self.assertEqual(session.surveys(), surveys)
+        self.assertDictEqual(session.session.get.call_args[1]["headers"], {"If-None-Match": "etag-1"})
+
+    def test_await_reports_generated(self):
+        session = EchoMobileSession()
+        session.session = mock.Mock()
+        session.session.get.side_effect = [
+            self.mock_response({"success": True, "tasks": {
+                "report_a": {"status": 1, "progress": 0, "total": 10},
+                "report_b": {"status": 3, "progress": 10, "total": 10}
+            }}),
+            self.mock_response({"success": True, "tasks": {
+                "report_a": {"status": 3, "progress": 10, "total": 10},
+                "report_b": {"status": 3, "progress": 10, "total": 10}
+            }})
+        ]
+
+        session.await_reports_generated(["a", "b"], poll_interval=0, jitter=0)
+
+        # Each poll should check the status of both reports at once.
+        self.assertEqual(session.session.get.call_count, 2)
+
+    def test_await_reports_generated_task_not_listed_yet(self):
+        session = EchoMobileSession()
+        session.session = mock.Mock()
+        session.session.get.side_effect = [
+            self.mock_response({"success": True, "tasks": {}}),
+            self.mock_response({"success": True, "tasks": {
+                "report_a": {"status": 3, "progress": 10, "total": 10}
+            }})
+        ]
+
+        # A report whose task has not been listed yet should be treated as still generating.
+        session.await_reports_generated(["a"], poll_interval=0, jitter=0)
+        self.assertEqual(session.session.get.call_count, 2)
+
+    def test_await_reports_generated_task_never_listed(self):
+        session = EchoMobileSession()
+        session.session = mock.Mock()
+        session.session.get.return_value = self.mock_response({"success": True, "tasks": {
+            "report_a": {"status": 3, "progress": 10, "total": 10}
+        }})
+
+        # A report which never appears, e.g. because its key was mistyped, should not be waited for forever.
+        with self.assertRaisesRegex(EchoMobileError, "report_b"):
+            session.await_reports_generated(["a", "b"], poll_interval=0, jitter=0, max_missing_polls=3)
+        self.assertEqual(session.session.get.call_count, 4)
+
+    def test_background_tasks_status_conditional_get(self):
+        tasks = {"report_a": {"status": 1, "progress": 0, "total": 10}}
+
+        session = EchoMobileSession()
+        session.session = mock.Mock()
+        session.session.get.side_effect = [
+            self.mock_response({"success": True, "tasks": tasks}, headers={"ETag": "v1"}),
+            self.mock_response(None, status_code=304)
+        ]
+
+        self.assertEqual(session.background_tasks_status(), tasks)
+        self.assertEqual(session.background_tasks_status(), tasks)
+        self.assertEqual(session.session.get.call_args[1]["headers"], {"If-None-Match": "v1"})
+
+    def test_await_report_generated_failed(self):
+        session = EchoMobileSession()
+        session.session = mock.Mock()
+        session.session.get.return_value = self.mock_response({"success": True, "tasks": {
+            "report_a": {"status": 4, "progress": 0, "total": 10}
+        }})
+
+        self.assertRaises(EchoMobileError, session.await_report_generated, "a")
+
+    def test_await_report_generated_polls_immediately(self):
+        session = EchoMobileSession()
+        session.session = mock.Mock()
+        session.session.get.return_value = self.mock_response({"success": True, "tasks": {
+            "report_a": {"status": 3, "progress": 10, "total": 10}
+        }})
+
+        with mock.patch("time.sleep") as sleep:
+            session.await_report_generated("a")
+
+        sleep.assert_not_called()
+        self.assertEqual(session.session.get.call_count, 1)
+
+    def test_generate_survey_report_sends_plain_ints(self):
+        session = EchoMobileSession()
+        session.session = mock.Mock()
+        session.session.post.return_value = self.mock_response({"success": True, "rkey": "abc"})
+
+        self.assertEqual(session.generate_survey_report("survey-key", wait_until_generated=False), "abc")
+        self.assertSetEqual(session.background_tasks, {"report_abc"})
+
+        # Enum members must be converted to plain ints, because on older versions of Python str() of an IntEnum
+        # member is e.g. "ReportType.SurveyReport" rather than "13".
+        params = session.session.post.call_args[1]["params"]
+        self.assertIs(type(params["type"]), int)
+        self.assertEqual(params["type"], 13)
+        self.assertIs(type(params["ftype"]), int)
+        self.assertEqual(params["gen"], "raw,label")
+        self.assertEqual(params["std_field"], "name,phone")
+
+    def test_delete_session_background_tasks(self):
+        session = EchoMobileSession()
+        session.session = mock.Mock()
+        session.session.post.side_effect = lambda url, params: self.mock_response(
+            {"success": False, "message": "Task not found"} if params["key"] == "report_b" else {"success": True}
+        )
+        session.background_tasks = {"report_a", "report_b", "report_c"}
+
+        # Every task should be deleted, even though deleting one of them fails.
+        self.assertRaises(EchoMobileError, session.delete_session_background_tasks)
+        self.assertEqual(session.session.post.call_count, 3)
+        self.assertSetEqual(session.background_tasks, {"report_b"})
+
+    def test_delete_session_background_tasks_keeps_unscheduled_tasks(self):
+        session = EchoMobileSession()
+        session.session = mock.Mock()
+        session.background_tasks = {"report_a", "report_b"}
+
+        # Tasks whose deletion could not even be scheduled must not be forgotten.
+        with mock.patch("concurrent.futures.ThreadPoolExecutor.submit",
+                        side_effect=RuntimeError("cannot schedule new futures after interpreter shutdown")):
+            self.assertRaises(RuntimeError, session.delete_session_background_tasks)
+        session.session.post.assert_not_called()
+        self.assertSetEqual(session.background_tasks, {"report_a", "report_b"})
+
+    def test_context_manager_closes_session(self):
+        session = EchoMobileSession()
+        session.session = mock.Mock()
+        session.session.post.return_value = self.mock_response({"success": False, "message": "Task not found"})
+        session.background_tasks = {"report_a"}
+
+        with self.assertRaises(EchoMobileError):
+            with session:
+                pass
+
+        # Failing to delete the background tasks must not prevent the connections from being closed.
+        session.session.close.assert_called_once_with()
+        self.assertSetEqual(session.background_tasks, {"report_a"})
+
+    def test_shared(self):
+        with mock.patch("atexit.register") as register, mock.patch.object(EchoMobileSession, "_shared", None):
+            session = EchoMobileSession.shared()
+            self.assertIs(EchoMobileSession.shared(), session)
+            register.assert_called_once_with(session.close, parallel=False)
+
+    def test_shared_closes_at_exit(self):
+        with mock.patch("atexit.register") as register, mock.patch.object(EchoMobileSession, "_shared", None):
+            session = EchoMobileSession.shared()
+        session.session = mock.Mock()
+        session.session.post.return_value = self.mock_response({"success": True})
+        session.background_tasks = {"report_a", "report_b"}
+
+        # Thread pools refuse new work during interpreter shutdown, so the registered callback must not use one.
+        callback, args, kwargs = register.call_args[0][0], register.call_args[0][1:], register.call_args[1]
+        with mock.patch("concurrent.futures.ThreadPoolExecutor.submit",
+                        side_effect=RuntimeError("cannot schedule new futures after interpreter shutdown")):
+            callback(*args, **kwargs)
+
+        self.assertEqual(session.session.post.call_count, 2)
+        self.assertSetEqual(session.background_tasks, set())
+        session.session.close.assert_called_once_with()
+
+    def test_quiet_logging(self):
+        session = EchoMobileSession(verbose=False)
+        with mock.patch("builtins.print") as print_:
+            session.log_start("Working... ")
+            session.log_done()
+        print_.assert_not_called()
+
+    def test_log_timing_per_thread(self):
+        session = EchoMobileSession(verbose=True)
+
+        def log_in_worker():
+            session.log_start("Worker... ")
+            session.log_done()
+
+        # Operations logged concurrently on other threads must not reset this thread's start time.
+        with mock.patch("builtins.print") as print_, mock.patch("time.monotonic", side_effect=[0, 100, 101, 5]):
+            session.log_start("Main... ")
+            worker = threading.Thread(target=log_in_worker)
+            worker.start()
+            worker.join()
+            session.log_done()
+
+        self.assertEqual(print_.call_args_list[-2], mock.call("Done (1.000s)"))
+        self.assertEqual(print_.call_args_list[-1], mock.call("Done (5.000s)"))
+
+    def test_log_without_log_start(self):
+        session = EchoMobileSession(verbose=True)
+
+        def log_in_worker():
+            session.log_progress("Worker... ", 50, end="")
+            session.log_done()
+
+        # Threads which never called log_start must still be able to log, e.g. the workers of download_reports.
+        with mock.patch("builtins.print") as print_:
+            worker = threading.Thread(target=log_in_worker)
+            worker.start()
+            worker.join()
+
+        self.assertEqual(print_.call_count, 2)
+        self.assertEqual(print_.call_args_list[-1], mock.call("Done"))
+
+    @staticmethod
+    def mock_report_response(chunks):
+        response = mock.MagicMock()
+        response.__enter__.return_value = response
+        response.iter_content.return_value = iter(chunks)
+        return response
+
+    def test_download_report_decodes_utf8(self):
+        response = requests.Response()
+        response.status_code = 200
+        response.headers["Content-Type"] = "text/csv"
+        response._content = "Name,Message\r\nZoë,Habari yako ☺\r\n".encode("utf-8")
+        # As set by requests when the response is received.
+        response.encoding = requests.utils.get_encoding_from_headers(response.headers)
+
+        session = EchoMobileSession()
+        session.session = mock.Mock()
+        session.session.get.return_value = response
+
+        # Without a charset, requests would decode text/csv as ISO-8859-1.
+        self.assertEqual(session.download_report("abc"), "Name,Message\r\nZoë,Habari yako ☺\r\n")
+
+    def test_download_report_to_file(self):
+        session = EchoMobileSession()
+        session.session = mock.Mock()
+        session.session.get.return_value = self.mock_report_response([b"a,b\r\n", b"1,\xc3\xa9\r\n"])
+
+        with tempfile.TemporaryDirectory() as temp_dir:
+            file_path = os.path.join(temp_dir, "report.csv")
+            session.download_report_to_file("abc", file_path, chunk_size=4)
+            with open(file_path, "rb") as f:
+                self.assertEqual(f.read(), b"a,b\r\n1,\xc3\xa9\r\n")
+
+        self.assertEqual(session.session.get.call_args[1]["params"], {"rkey": "abc"})
+        session.session.get.return_value.iter_content.assert_called_once_with(4)
+
+    def test_download_report_with_file_path(self):
+        session = EchoMobileSession()
+        session.session = mock.Mock()
+        session.session.get.return_value = self.mock_report_response([b"a,b\r\n", b"1,2\r\n"])
+
+        with tempfile.TemporaryDirectory() as temp_dir:
+            file_path = os.path.join(temp_dir, "report.csv")
+            self.assertIsNone(session.download_report("abc", file_path=file_path))
+            with open(file_path, "rb") as f:
+                self.assertEqual(f.read(), b"a,b\r\n1,2\r\n")
+
+    def mock_reports_session(self, report_keys):
+        """
+        Returns a mock requests session which reports that every one of the given reports has been generated, and
+        serves the CSV "report,<report_key>" for each. The first report is the slowest to download.
+        """
+        def get(url, params=None, headers=None, stream=False):
+            if url == EchoMobileSession._URL_BACKGROUND_TASKS:
+                return self.mock_response({"success": True, "tasks": {
+                    "report_" + report_key: {"status": 3, "progress": 10, "total": 10} for report_key in report_keys
+                }})
+
+            if params["rkey"] == report_keys[0]:
+                time.sleep(0.05)
+            response = mock.Mock()
+            response.encoding = "utf-8"
+            response.text = "report,{}".format(params["rkey"])
+            return response
+
+        session = mock.Mock()
+        session.get.side_effect = get
+        return session
+
+    def test_download_reports(self):
+        session = EchoMobileSession()
+        session.session = self.mock_reports_session(["a", "b", "c"])
+
+        # Reports should be returned in the order requested, even when they finish downloading in another order.
+        self.assertEqual(session.download_reports(["a", "b", "c"]), ["report,a", "report,b", "report,c"])
+
+    def test_survey_reports_for_keys(self):
+        session = EchoMobileSession()
+        session.session = self.mock_reports_session(["rkey-a", "rkey-b", "rkey-c"])
+        session.session.post.side_effect = lambda url, params: self.mock_response(
+            {"success": True, "rkey": "rkey-" + params["target"]})
+
+        self.assertEqual(session.survey_reports_for_keys(["a", "b", "c"]),
+                         ["report,rkey-a", "report,rkey-b", "report,rkey-c"])
+        self.assertSetEqual(session.background_tasks, {"report_rkey-a", "report_rkey-b", "report_rkey-c"})
+
+    def test_echo_mobile_date_to_iso_login_timezone(self):
+        session = EchoMobileSession()
+        self.assertRaises(NoSessionDataError, session.echo_mobile_date_to_iso, "2018-06-01 19:20")
+
+        session.login_data = {"tz": "Africa/Nairobi"}
+        self.assertEqual(session.echo_mobile_date_to_iso("2018-06-01 19:20"), "2018-06-01T19:20:00+03:00")
+
+        session.login_data = {"tz": "UTC"}
+        self.assertEqual(session.echo_mobile_date_to_iso("2018-06-01 19:20"), "2018-06-01T19:20:00+00:00")
+
+    def test_echo_mobile_date_to_iso_formats(self):
+        session = EchoMobileSession()
+        session.login_data = {"tz": "UTC"}
+
+        # Dates which are not zero-padded are not in the fixed-width format, but strptime still accepts them.
+        self.assertEqual(session.echo_mobile_date_to_iso("2018-6-1 9:05"), "2018-06-01T09:05:00+00:00")
+        self.assertRaises(ValueError, session.echo_mobile_date_to_iso, "2018-13-01 19:20")
+        self.assertRaises(ValueError, session.echo_mobile_date_to_iso, "not a date")
+
+        # Fixed-width strings containing characters which int() would accept, but which are not digits.
+        self.assertRaises(ValueError, session.echo_mobile_date_to_iso, "2_18-06-01 19:20")
+        self.assertRaises(ValueError, session.echo_mobile_date_to_iso, "+018-06-01 19:20")
+        self.assertRaises(ValueError, session.echo_mobile_date_to_iso, "2018-06-01 19:2 ")
@@ -0,0 +1,70 @@
+import io
+import os
+import tempfile
+import unittest
+from unittest import mock
+
+from export_utils import dump_atomically, read_report_rows
+
+
+class TestExportUtils(unittest.TestCase):
+    def test_read_report_rows(self):
+        report = io.StringIO(
+            "phone,name,invite_date,complete_date\r\n"
+            "+254700000000,Alice,2018-06-01 19:20,2018-06-01 19:25\r\n"
+            "\r\n"
+            "+254700000001,Bob,2018-06-01 19:21\r\n"
+        )
+
+        rows = list(read_report_rows(report, "phone", ["name"]))
+
+        # Blank lines should be skipped, and fields missing from short rows set to None, as csv.DictReader does.
+        self.assertEqual(rows, [
+            ("+254700000000", {"invite_date": "2018-06-01 19:20", "complete_date": "2018-06-01 19:25"}),
+            ("+254700000001", {"invite_date": "2018-06-01 19:21", "complete_date": None})
+        ])
+
+    def test_read_report_rows_long_row(self):
+        report = io.StringIO(
+            "phone,name,invite_date\r\n"
+            "+254700000000,Alice,2018-06-01 19:20,extra,fields\r\n"
+        )
+
+        # Fields beyond the end of the header must not be lost. Keep them under None, as csv.DictReader does.
+        self.assertEqual(list(read_report_rows(report, "phone", ["name"])), [
+            ("+254700000000", {"invite_date": "2018-06-01 19:20", None: ["extra", "fields"]})
+        ])
+
+    def test_read_report_rows_empty_report(self):
+        self.assertEqual(list(read_report_rows(io.StringIO(""), "phone")), [])
+
+    def test_dump_atomically(self):
+        table = mock.Mock()
+        table.dump.side_effect = lambda f: f.write("{}")
+
+        with tempfile.TemporaryDirectory() as temp_dir:
+            path = os.path.join(temp_dir, "uuids.json")
+            with open(path, "w") as f:
+                f.write("old")
+
+            dump_atomically(table, path)
+
+            with open(path, "r") as f:
+                self.assertEqual(f.read(), "{}")
+            self.assertEqual(os.listdir(temp_dir), ["uuids.json"])
+
+    def test_dump_atomically_failure(self):
+        table = mock.Mock()
+        table.dump.side_effect = ValueError("Failed to serialise table")
+
+        with tempfile.TemporaryDirectory() as temp_dir:
+            path = os.path.join(temp_dir, "uuids.json")
+            with open(path, "w") as f:
+                f.write("old")
+
+            self.assertRaises(ValueError, dump_atomically, table, path)
+
+            # The existing table should be untouched, and no temporary file left behind.
+            with open(path, "r") as f:
+                self.assertEqual(f.read(), "old")
+            self.assertEqual(os.listdir(temp_dir), ["uuids.json"])